@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+from db import Database
+from models import Alert
+from services import DexScreenerAPI
+
+logger = logging.getLogger(__name__)
+
+ABOVE = "above"
+BELOW = "below"
+
+# (threshold, alert id) - the id breaks ties so entries stay unique
+Entry = Tuple[float, int]
+
+
+class TokenAlerts:
+    """Sorted threshold lists for a single token.
+
+    Armed alerts wait for a crossing; fired alerts wait for the price to cross
+    back before they are re-armed.
+    """
+
+    def __init__(self):
+        self.armed_above: List[Entry] = []
+        self.armed_below: List[Entry] = []
+        self.fired_above: List[Entry] = []
+        self.fired_below: List[Entry] = []
+
+    def add(self, alert: Alert) -> None:
+        entry = (alert.price, alert.id)
+        if alert.direction == ABOVE:
+            insort(self.fired_above if alert.fired else self.armed_above, entry)
+        else:
+            insort(self.fired_below if alert.fired else self.armed_below, entry)
+
+    def remove(self, alert: Alert) -> None:
+        entry = (alert.price, alert.id)
+        if alert.direction == ABOVE:
+            lists = (self.armed_above, self.fired_above)
+        else:
+            lists = (self.armed_below, self.fired_below)
+        for entries in lists:
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+                return
+
+    def __len__(self) -> int:
+        return (
+            len(self.armed_above)
+            + len(self.armed_below)
+            + len(self.fired_above)
+            + len(self.fired_below)
+        )
+
+    def evaluate(self, price: float) -> Tuple[List[int], List[int]]:
+        """Apply a new price. Returns (fired alert ids, re-armed alert ids)."""
+        # Re-arm first: a re-armed alert cannot fire at the same price.
+        i = bisect_right(self.fired_above, (price, float("inf")))
+        rearmed_above = self.fired_above[i:]
+        del self.fired_above[i:]
+
+        i = bisect_left(self.fired_below, (price, float("-inf")))
+        rearmed_below = self.fired_below[:i]
+        del self.fired_below[:i]
+
+        i = bisect_right(self.armed_above, (price, float("inf")))
+        fired_above = self.armed_above[:i]
+        del self.armed_above[:i]
+
+        i = bisect_left(self.armed_below, (price, float("-inf")))
+        fired_below = self.armed_below[i:]
+        del self.armed_below[i:]
+
+        for entry in rearmed_above:
+            insort(self.armed_above, entry)
+        for entry in rearmed_below:
+            insort(self.armed_below, entry)
+        for entry in fired_above:
+            insort(self.fired_above, entry)
+        for entry in fired_below:
+            insort(self.fired_below, entry)
+
+        fired = [alert_id for _, alert_id in fired_above + fired_below]
+        rearmed = [alert_id for _, alert_id in rearmed_above + rearmed_below]
+        return fired, rearmed
+
+
+class RateLimitedSender:
+    """Sends messages no faster than Telegram's global and per-chat limits."""
+
+    def __init__(self, per_second: float = 25.0, per_chat_interval: float = 1.0):
+        self.min_interval = 1.0 / per_second
+        self.per_chat_interval = per_chat_interval
+        self._lock = asyncio.Lock()
+        self._last_send = 0.0
+        self._last_chat_send: Dict[int, float] = {}
+
+    async def send(self, bot: Bot, chat_id: int, text: str) -> bool:
+        async with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._last_send + self.min_interval - now,
+                self._last_chat_send.get(chat_id, 0.0) + self.per_chat_interval - now,
+            )
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_send = self._last_chat_send[chat_id] = time.monotonic()
+
+        try:
+            await bot.send_message(chat_id, text)
+            return True
+        except RetryAfter as e:
+            logger.warning(f"Rate limited by Telegram, retrying in {e.retry_after}s")
+            await asyncio.sleep(float(e.retry_after))
+            return await self.send(bot, chat_id, text)
+        except TelegramError as e:
+            logger.error(f"Error sending alert to {chat_id}: {e}")
+            return False
+
+
+class AlertService:
+    # Bounds the tokens any one user adds to every tick's fetch
+    MAX_ALERTS_PER_USER = 10
+
+    def __init__(
+        self,
+        db: Database,
+        dexscreener: DexScreenerAPI,
+        interval: float = 30.0,
+        sender: Optional[RateLimitedSender] = None,
+    ):
+        self.db = db
+        self.dexscreener = dexscreener
+        self.interval = interval
+        self.sender = sender or RateLimitedSender()
+        self.alerts: Dict[int, Alert] = {}
+        self.tokens: Dict[str, TokenAlerts] = {}
+        self.user_alert_counts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> None:
+        """Rebuild the in-memory index from persisted alerts."""
+        self.alerts.clear()
+        self.tokens.clear()
+        self.user_alert_counts.clear()
+        for alert in self.db.get_all_alerts():
+            self._index(alert)
+
+    def _index(self, alert: Alert) -> None:
+        self.alerts[alert.id] = alert
+        self.tokens.setdefault(alert.token_address, TokenAlerts()).add(alert)
+        self.user_alert_counts[alert.telegram_id] += 1
+
+    def can_add_alert(self, telegram_id: int) -> bool:
+        return self.user_alert_counts[telegram_id] < self.MAX_ALERTS_PER_USER
+
+    def add_alert(
+        self, telegram_id: int, token_address: str, direction: str, price: float
+    ) -> Alert:
+        alert = self.db.create_alert(telegram_id, token_address, direction, price)
+        self._index(alert)
+        return alert
+
+    def remove_alert(self, telegram_id: int, alert_id: int) -> bool:
+        alert = self.db.delete_alert(telegram_id, alert_id)
+        if not alert:
+            return False
+
+        indexed = self.alerts.pop(alert.id, None)
+        if indexed:
+            self.user_alert_counts[alert.telegram_id] -= 1
+        token_alerts = self.tokens.get(alert.token_address)
+        if indexed and token_alerts:
+            token_alerts.remove(indexed)
+            if not token_alerts:
+                del self.tokens[alert.token_address]
+        return True
+
+    async def tick(self, bot: Bot) -> None:
+        """Fetch each watched token once and notify owners of crossed alerts."""
+        notifications: Dict[int, List[str]] = defaultdict(list)
+
+        # Batched: one request per DexScreenerAPI.MAX_BATCH watched tokens
+        prices = await asyncio.to_thread(
+            self.dexscreener.get_tokens_data, list(self.tokens)
+        )
+        for token_address, token_info in prices.items():
+            token_alerts = self.tokens.get(token_address)
+            if not token_info or not token_alerts:
+                continue
+
+            symbol, _, price_usd, _ = token_info
+            fired, rearmed = token_alerts.evaluate(price_usd)
+
+            self.db.set_alerts_fired(rearmed, False)
+            self.db.set_alerts_fired(fired, True)
+            for alert_id in rearmed:
+                self.alerts[alert_id].fired = False
+            for alert_id in fired:
+                alert = self.alerts[alert_id]
+                alert.fired = True
+                notifications[alert.telegram_id].append(
+                    f"{symbol} is {alert.direction} ${alert.price:,.6g} "
+                    f"(now ${price_usd:,.6g})"
+                )
+
+        # One message per user, however many of their alerts fired
+        for telegram_id, lines in notifications.items():
+            await self.sender.send(
+                bot, telegram_id, "🔔 Price alert\n\n" + "\n".join(lines)
+            )
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            try:
+                await self.tick(bot)
+            except Exception as e:
+                logger.error(f"Error checking price alerts: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, bot: Bot) -> None:
+        self.load()
+        self._task = asyncio.get_running_loop().create_task(self.run(bot))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,23 +1,45 @@
+import logging
 from typing import Optional
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
 from db import Database
-from services import DexScreenerAPI
+from ledger import (
+    MAX_AMOUNT,
+    base_units_to_tokens,
+    lamports_for_tokens,
+    lamports_to_sol,
+    portion,
+    sol_to_lamports,
+    tokens_for_lamports,
+)
+from portfolio import portfolio_keyboard, remember_portfolio_render
+from services import DexScreenerAPI, PortfolioService, SolanaRPC
+
+logger = logging.getLogger(__name__)
 
 AWAITING_CUSTOM_AMOUNT = 1
 
 
 class CallbackHandlers:
-    def __init__(self, db: Database):
+    # BadRequest messages for portfolio messages that can only be re-sent
+    UNEDITABLE_MESSAGE_ERRORS = (
+        "message can't be edited",
+        "message to edit not found",
+    )
+
+    def __init__(self, db: Database, dex_api: DexScreenerAPI, solana_rpc: SolanaRPC):
         self.db = db
-        self.dex_api = DexScreenerAPI()
+        self.dex_api = dex_api
+        self.solana_rpc = solana_rpc
+        self.portfolio_service = PortfolioService(db, dex_api)
 
     async def execute_buy(
-        self, telegram_id: int, token_address: str, sol_amount: float
+        self, telegram_id: int, token_address: str, lamports: int
     ) -> Optional[str]:
         """Execute buy operation and return status message."""
         account = self.db.get_account(telegram_id)
-        if not account or account.sol_balance < sol_amount:
+        if not account or lamports <= 0 or account.lamports < lamports:
             return "Insufficient SOL balance for this purchase."
 
         token_info = self.dex_api.get_token_data(token_address)
@@ -26,16 +48,29 @@ class CallbackHandlers:
 
         _, price_native, price_usd, market_cap = token_info
 
-        # Calculate token quantity based on SOL amount
-        token_quantity = sol_amount / price_native
-
         # Update or create position
         position = self.db.get_position(telegram_id, token_address)
+        decimals = (
+            position.decimals
+            if position
+            else self.solana_rpc.get_token_decimals(token_address)
+        )
+
+        # Calculate token quantity based on SOL amount
+        token_quantity = tokens_for_lamports(lamports, price_native, decimals)
+        if token_quantity <= 0:
+            return "Amount too small to buy any tokens."
+        held_quantity = position.quantity if position else 0
+        held_cost = position.cost_lamports if position else 0
+        if (
+            held_quantity + token_quantity > MAX_AMOUNT
+            or held_cost + lamports > MAX_AMOUNT
+        ):
+            return "Amount too large: the position would exceed the maximum size."
+
         if position:
             # Update existing position
             total_quantity = position.quantity + token_quantity
-            total_cost = (position.quantity * position.entry_price) + sol_amount
-            new_entry_price = total_cost / total_quantity
             new_entry_mcap = (
                 market_cap * token_quantity + position.quantity * position.entry_mcap
             ) / total_quantity
@@ -44,7 +79,8 @@ class CallbackHandlers:
                 telegram_id=telegram_id,
                 token_address=token_address,
                 quantity=total_quantity,
-                entry_price=new_entry_price,
+                decimals=decimals,
+                cost_lamports=position.cost_lamports + lamports,
                 entry_mcap=new_entry_mcap,
             )
         else:
@@ -53,19 +89,20 @@ class CallbackHandlers:
                 telegram_id=telegram_id,
                 token_address=token_address,
                 quantity=token_quantity,
-                entry_price=price_native,
+                decimals=decimals,
+                cost_lamports=lamports,
                 entry_mcap=market_cap,
             )
 
         # Update account balance
-        account.sol_balance -= sol_amount
+        account.lamports -= lamports
         self.db.update_account(account)
 
         return (
             f"Purchase successful!\n"
-            f"Bought: {token_quantity:.9f} tokens\n"
+            f"Bought: {base_units_to_tokens(token_quantity, decimals):.9f} tokens\n"
             f"Price: {price_native:.9f} SOL\n"
-            f"Total: {sol_amount:.3f} SOL\n"
+            f"Total: {lamports_to_sol(lamports):.3f} SOL\n"
             f"Market Cap: ${market_cap:,.0f}"
         )
 
@@ -94,14 +131,11 @@ class CallbackHandlers:
 
         try:
             if buy_type == "fixed":
-                sol_amount = float(amount)
+                lamports = sol_to_lamports(amount)
             else:  # percent
-                percentage = float(amount)
-                sol_amount = account.sol_balance * (percentage / 100)
+                lamports = portion(account.lamports, amount)
 
-            result = await self.execute_buy(
-                query.from_user.id, token_address, sol_amount
-            )
+            result = await self.execute_buy(query.from_user.id, token_address, lamports)
             await query.message.chat.send_message(result)
 
         except ValueError as e:
@@ -153,8 +187,19 @@ class CallbackHandlers:
         _, price_native, price_usd, market_cap = token_info
 
         # Calculate sell amount
-        sell_quantity = position.quantity * (percentage / 100)
-        sol_received = sell_quantity * price_native
+        sell_quantity = portion(position.quantity, percentage)
+        if sell_quantity <= 0:
+            return "Amount too small to sell."
+
+        lamports_received = lamports_for_tokens(
+            sell_quantity, price_native, position.decimals
+        )
+        # Cost basis leaves the position in proportion to the quantity sold
+        cost_basis = position.cost_lamports * sell_quantity // position.quantity
+
+        account = self.db.get_account(telegram_id)
+        if account.lamports + lamports_received > MAX_AMOUNT:
+            return "Amount too large: the balance would exceed the maximum size."
 
         try:
             # Update position
@@ -164,30 +209,29 @@ class CallbackHandlers:
                     telegram_id=telegram_id,
                     token_address=token_address,
                     quantity=remaining_quantity,
-                    entry_price=position.entry_price,
+                    decimals=position.decimals,
+                    cost_lamports=position.cost_lamports - cost_basis,
                     entry_mcap=position.entry_mcap,
                 )
             else:
                 self.db.delete_position(telegram_id, token_address)
 
             # Update account balance
-            account = self.db.get_account(telegram_id)
-            account.sol_balance += sol_received
+            account.lamports += lamports_received
             self.db.update_account(account)
 
             # Calculate profit/loss
-            cost_basis = sell_quantity * position.entry_price
-            profit_loss = sol_received - cost_basis
+            profit_loss = lamports_received - cost_basis
             profit_loss_percent = (
                 (profit_loss / cost_basis) * 100 if cost_basis > 0 else 0
             )
 
             return (
                 f"Sell successful!\n"
-                f"Sold: {sell_quantity:.9f} tokens ({percentage}%)\n"
+                f"Sold: {base_units_to_tokens(sell_quantity, position.decimals):.9f} tokens ({percentage}%)\n"
                 f"Price: {price_native:.9f} SOL\n"
-                f"Received: {sol_received:.3f} SOL\n"
-                f"P/L: {profit_loss:.3f} SOL ({profit_loss_percent:+.2f}%)"
+                f"Received: {lamports_to_sol(lamports_received):.3f} SOL\n"
+                f"P/L: {lamports_to_sol(profit_loss):.3f} SOL ({profit_loss_percent:+.2f}%)"
             )
         except Exception as e:
             print(e)
@@ -220,3 +264,62 @@ class CallbackHandlers:
             )
 
         return ConversationHandler.END
+
+    async def handle_portfolio_callback(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        query = update.callback_query
+
+        # Parse callback data
+        _, owner_id, page = query.data.split("_")
+        owner_id = int(owner_id)
+
+        if query.from_user.id != owner_id:
+            await query.answer(
+                "This isn't your portfolio. Use /portfolio to see yours."
+            )
+            return
+
+        account = self.db.get_account(owner_id)
+        if not account:
+            await query.answer("Account not found. Please use /start first.")
+            return
+
+        positions = self.db.get_positions(owner_id)
+        summary, page, pages = self.portfolio_service.get_portfolio_page(
+            account, positions, int(page)
+        )
+        keyboard = portfolio_keyboard(owner_id, page, pages)
+
+        message_id = query.message.message_id
+        renders = context.chat_data.get("portfolio_renders", {})
+        if renders.get(message_id) == summary:
+            await query.answer("Already up to date")
+            return
+
+        try:
+            await query.edit_message_text(
+                summary, parse_mode="Markdown", reply_markup=keyboard
+            )
+        except BadRequest as e:
+            error = str(e).lower()
+            if any(reason in error for reason in self.UNEDITABLE_MESSAGE_ERRORS):
+                # Too old to edit or deleted: send the page afresh
+                logger.warning(f"Could not edit portfolio message: {e}")
+                await query.answer()
+                message = await query.message.chat.send_message(
+                    summary, parse_mode="Markdown", reply_markup=keyboard
+                )
+                remember_portfolio_render(
+                    context.chat_data, message.message_id, summary
+                )
+                return
+            # Untracked messages can still render to identical content; any
+            # other error (e.g. unparseable Markdown) would fail a resend too
+            if "not modified" not in error:
+                logger.error(f"Error updating portfolio message: {e}")
+                await query.answer("Unable to update the portfolio. Please try again.")
+                return
+
+        remember_portfolio_render(context.chat_data, message_id, summary)
+        await query.answer()
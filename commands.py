@@ -1,16 +1,40 @@
+import asyncio
 import logging
+import math
+import os
+import time
+from typing import Collection
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
+from alerts import ABOVE, BELOW, AlertService
 from db import Database
+from ledger import LAMPORTS_PER_SOL, MAX_AMOUNT, sol_to_lamports
+from portfolio import portfolio_keyboard, remember_portfolio_render
+from tracing import SamplingProfiler
 from services import PortfolioService, DexScreenerAPI
 
 logger = logging.getLogger(__name__)
 
 
 class CommandHandlers:
-    def __init__(self, db: Database):
+    MAX_PROFILE_SECONDS = 300
+
+    def __init__(
+        self,
+        db: Database,
+        dex_api: DexScreenerAPI,
+        alert_service: AlertService,
+        admin_ids: Collection[int] = (),
+        profiling_enabled: bool = False,
+        debug_dir: str = "debug",
+    ):
         self.db = db
-        self.dex_api = DexScreenerAPI()
+        self.dex_api = dex_api
+        self.alert_service = alert_service
+        self.admin_ids = set(admin_ids)
+        self.profiling_enabled = profiling_enabled
+        self.debug_dir = debug_dir
+        self.profiler = SamplingProfiler()
         self.portfolio_service = PortfolioService(db, self.dex_api)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -25,7 +49,7 @@ class CommandHandlers:
             return
 
         # Create new account with 10 SOL
-        account = self.db.create_account(user_id, 10.0)
+        account = self.db.create_account(user_id, 10 * LAMPORTS_PER_SOL)
 
         await update.message.reply_text(
             "Welcome to the Paper Trading Bot! 🚀\n\n"
@@ -46,7 +70,7 @@ class CommandHandlers:
                 return
 
             try:
-                new_balance = float(context.args[0])
+                new_balance = sol_to_lamports(context.args[0])
             except ValueError:
                 await update.message.reply_text(
                     "Invalid amount provided. Please enter a valid number."
@@ -56,6 +80,11 @@ class CommandHandlers:
             if new_balance <= 0:
                 await update.message.reply_text("Balance must be greater than 0 SOL")
                 return
+            if new_balance > MAX_AMOUNT:
+                await update.message.reply_text(
+                    f"Balance must be at most {MAX_AMOUNT // LAMPORTS_PER_SOL:,} SOL"
+                )
+                return
 
             user_id = update.effective_user.id
             account = self.db.reset_account(user_id, new_balance)
@@ -84,8 +113,15 @@ class CommandHandlers:
             return
 
         positions = self.db.get_positions(user_id)
-        summary = self.portfolio_service.get_portfolio_summary(account, positions)
-        await update.message.reply_text(summary, parse_mode="Markdown")
+        summary, page, pages = self.portfolio_service.get_portfolio_page(
+            account, positions
+        )
+        message = await update.message.reply_text(
+            summary,
+            parse_mode="Markdown",
+            reply_markup=portfolio_keyboard(user_id, page, pages),
+        )
+        remember_portfolio_render(context.chat_data, message.message_id, summary)
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(
@@ -93,6 +129,9 @@ class CommandHandlers:
             "/start - Create new account with 10 SOL\n"
             "/reload <amount> - Reset account with new balance\n"
             "/portfolio - View your current portfolio\n"
+            "/watch <token_address> above|below <price> - Set a USD price alert\n"
+            "/alerts - List your price alerts\n"
+            "/unwatch <alert_id> - Remove a price alert\n"
             "/help - Show this help message"
         )
 
@@ -196,15 +235,15 @@ class CommandHandlers:
             _, price_native, price_usd, market_cap = token_info
 
             # Calculate current position value
-            position_value = position.quantity * price_native
-            cost_basis = position.quantity * position.entry_price
+            position_value = position.token_quantity * price_native
+            cost_basis = position.token_quantity * position.entry_price
             unrealized_pl = position_value - cost_basis
             pl_percent = (unrealized_pl / cost_basis) * 100 if cost_basis > 0 else 0
 
             # Display position info and sell options
             message = (
                 f"Position Information:\n"
-                f"Quantity: {position.quantity:.9f}\n"
+                f"Quantity: {position.token_quantity:.9f}\n"
                 f"Entry: {position.entry_price:.9f} SOL\n"
                 f"Current: ${price_usd:.4f} ({price_native:.9f} SOL) \n"
                 f"Value: {position_value:.3f} SOL\n"
@@ -236,3 +275,161 @@ class CommandHandlers:
             await update.message.reply_text(
                 "An error occurred while processing your request. Please try again."
             )
+
+    async def watch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        try:
+            if not context.args or len(context.args) != 3:
+                await update.message.reply_text(
+                    "Please provide the token address, direction and USD price.\n"
+                    "Usage: /watch <token_address> above|below <price>"
+                )
+                return
+
+            token_address, direction, price_arg = context.args
+            direction = direction.lower()
+            if direction not in (ABOVE, BELOW):
+                await update.message.reply_text(
+                    "Direction must be either 'above' or 'below'."
+                )
+                return
+
+            try:
+                price = float(price_arg)
+            except ValueError:
+                await update.message.reply_text(
+                    "Invalid price provided. Please enter a valid number."
+                )
+                return
+
+            if not math.isfinite(price) or price <= 0:
+                await update.message.reply_text("Price must be a number greater than 0")
+                return
+
+            user_id = update.effective_user.id
+            if not self.db.get_account(user_id):
+                await update.message.reply_text(
+                    "Please use /start to create an account first."
+                )
+                return
+
+            if not self.alert_service.can_add_alert(user_id):
+                await update.message.reply_text(
+                    f"You can have at most {AlertService.MAX_ALERTS_PER_USER} price "
+                    "alerts. Use /unwatch to remove one first."
+                )
+                return
+
+            token_info = self.dex_api.get_token_data(token_address)
+            if not token_info:
+                await update.message.reply_text(
+                    "Unable to fetch token information. Please verify the token address."
+                )
+                return
+
+            symbol, _, price_usd, _ = token_info
+            alert = self.alert_service.add_alert(
+                user_id, token_address, direction, price
+            )
+
+            await update.message.reply_text(
+                f"Alert #{alert.id} set: {symbol} {direction} ${price:,.6g}\n"
+                f"Current price: ${price_usd:,.6g}"
+            )
+
+        except Exception as e:
+            logger.error(f"Error in watch command: {e}")
+            await update.message.reply_text(
+                "An error occurred while processing your request. Please try again."
+            )
+
+    async def alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        alerts = self.db.get_alerts(update.effective_user.id)
+
+        if not alerts:
+            await update.message.reply_text(
+                "You have no price alerts. Use /watch to create one."
+            )
+            return
+
+        message = "Price Alerts:\n\n"
+        for alert in alerts:
+            status = "fired" if alert.fired else "armed"
+            symbol = self.dex_api.token_metadata.get(alert.token_address, {}).get(
+                "symbol", "?"
+            )
+            message += (
+                f"#{alert.id} {symbol} `{alert.token_address}`\n"
+                f"  {alert.direction} ${alert.price:,.6g} ({status})\n"
+            )
+        await update.message.reply_text(message, parse_mode="Markdown")
+
+    async def unwatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not context.args or len(context.args) != 1:
+            await update.message.reply_text(
+                "Please provide the alert id.\n" "Usage: /unwatch <alert_id>"
+            )
+            return
+
+        try:
+            alert_id = int(context.args[0].lstrip("#"))
+        except ValueError:
+            await update.message.reply_text("Invalid alert id provided.")
+            return
+
+        if self.alert_service.remove_alert(update.effective_user.id, alert_id):
+            await update.message.reply_text(f"Alert #{alert_id} removed.")
+        else:
+            await update.message.reply_text("No alert found with that id.")
+
+    async def debug(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Admin-only diagnostics. Must be registered with block=False so that
+        other updates keep flowing (and get sampled) while profiling."""
+        if update.effective_user.id not in self.admin_ids:
+            return
+
+        if not self.profiling_enabled:
+            await update.message.reply_text(
+                "Profiling is disabled. Set PROFILING=1 to enable it."
+            )
+            return
+
+        if not context.args or len(context.args) != 2 or context.args[0] != "profile":
+            await update.message.reply_text("Usage: /debug profile <seconds>")
+            return
+
+        try:
+            seconds = float(context.args[1])
+        except ValueError:
+            await update.message.reply_text("Invalid duration provided.")
+            return
+
+        if not 0 < seconds <= self.MAX_PROFILE_SECONDS:
+            await update.message.reply_text(
+                f"Duration must be between 0 and {self.MAX_PROFILE_SECONDS} seconds"
+            )
+            return
+
+        if self.profiler.running:
+            await update.message.reply_text("A profile is already running.")
+            return
+
+        # Called on the event loop thread, which is the one we want to sample
+        self.profiler.start()
+        await update.message.reply_text(f"Profiling for {seconds:g}s...")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.profiler.stop()
+
+        path = self.profiler.dump(
+            os.path.join(
+                self.debug_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+            )
+        )
+        samples = sum(self.profiler.samples.values())
+        logger.info(f"Wrote {samples} profile samples to {path}")
+
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                f, caption=f"{samples} samples over {seconds:g}s (collapsed stacks)"
+            )
@@ -1,30 +1,209 @@
 # database/db.py
+from collections import OrderedDict
+from sqlalchemy import Connection, inspect
 from sqlmodel import SQLModel, Session, create_engine, select
-from typing import Optional, List
-from models import Account, Position
+from typing import Any, Callable, Dict, Optional, List
+from ledger import DEFAULT_TOKEN_DECIMALS, LAMPORTS_PER_SOL, lamports_for_tokens
+from models import Account, Alert, Position
+from tracing import traced_methods
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the models change, adding a migration from the previous version
+SCHEMA_VERSION = 2
 
+
+def _migrate_float_ledger(conn: Connection) -> None:
+    """v1 -> v2: float SOL balances and quantities become lamports and base units.
+
+    SQLite can't change column types in place, so the two tables are renamed,
+    recreated from the models and copied across, rounding to the nearest
+    lamport or base unit. Quantities that round to zero are swept by
+    compact_dust_positions.
+    """
+    # Keep other tables' foreign keys pointing at "account" across the rename
+    conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+    conn.exec_driver_sql("ALTER TABLE account RENAME TO account_v1")
+    conn.exec_driver_sql("ALTER TABLE position RENAME TO position_v1")
+    conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+
+    SQLModel.metadata.create_all(conn, tables=[Account.__table__, Position.__table__])
+
+    conn.exec_driver_sql(
+        "INSERT INTO account (telegram_id, lamports) "
+        "SELECT telegram_id, "
+        f"CAST(ROUND(sol_balance * {LAMPORTS_PER_SOL}) AS INTEGER) "
+        "FROM account_v1"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO position "
+        "(id, telegram_id, token_address, quantity, decimals, cost_lamports, entry_mcap) "
+        "SELECT id, telegram_id, token_address, "
+        f"CAST(ROUND(quantity * {10 ** DEFAULT_TOKEN_DECIMALS}) AS INTEGER), "
+        f"{DEFAULT_TOKEN_DECIMALS}, "
+        f"CAST(ROUND(quantity * entry_price * {LAMPORTS_PER_SOL}) AS INTEGER), "
+        "entry_mcap FROM position_v1"
+    )
+    conn.exec_driver_sql("DROP TABLE position_v1")
+    conn.exec_driver_sql("DROP TABLE account_v1")
+
+
+# version -> migration to version + 1
+MIGRATIONS: Dict[int, Callable[[Connection], None]] = {
+    1: _migrate_float_ledger,
+}
+
+
+@traced_methods("db")
 class Database:
+    # Number of most recently active users whose rows are kept in memory
+    HOT_USERS = 1000
+
     def __init__(self, db_url: str = "sqlite:///paper_trading.db"):
         self.db_url = db_url
         self.engine = create_engine(db_url)
-        SQLModel.metadata.create_all(self.engine)
+        self._ensure_schema()
+
+        # telegram_id -> row dicts, most recently used last. Fresh model
+        # instances are built on every read so callers can mutate them freely.
+        self._hot_accounts: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._hot_positions: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+
+    def _ensure_schema(self) -> None:
+        """Create tables only when the stored schema version is out of date."""
+        if self.engine.dialect.name != "sqlite":
+            SQLModel.metadata.create_all(self.engine)
+            return
+
+        with self.engine.connect() as conn:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+            leftovers = [
+                name
+                for (name,) in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' "
+                    "AND name IN ('account_v1', 'position_v1')"
+                )
+            ]
+
+        # Left behind by an interrupted upgrade from before it was atomic. The
+        # live tables may be empty, so starting would hide every balance.
+        if leftovers:
+            raise RuntimeError(
+                f"Database holds {', '.join(leftovers)} from an interrupted schema "
+                "upgrade; restore them as account/position before starting"
+            )
+
+        if version == SCHEMA_VERSION:
+            return
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than {SCHEMA_VERSION}"
+            )
+
+        logger.info(f"Upgrading database schema from {version} to {SCHEMA_VERSION}")
+        with self.engine.connect() as conn:
+            # pysqlite runs DDL outside of its implicit transactions, so take
+            # control of them: either the whole upgrade lands or none of it does
+            conn.execution_options(isolation_level="AUTOCOMMIT")
+            conn.exec_driver_sql("BEGIN")
+            try:
+                # Databases created before versioning hold the v1 tables
+                if version == 0 and inspect(conn).has_table("account"):
+                    version = 1
+                if version > 0:
+                    for from_version in range(version, SCHEMA_VERSION):
+                        MIGRATIONS[from_version](conn)
+
+                SQLModel.metadata.create_all(conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+
+    def file_stamp(self) -> Optional[List[int]]:
+        """(mtime, size) of the SQLite file, used to detect out-of-band writes."""
+        path = self.engine.url.database
+        if self.engine.dialect.name != "sqlite" or not path or path == ":memory:":
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _remember(self, cache: OrderedDict, telegram_id: int, value: Any) -> None:
+        cache[telegram_id] = value
+        cache.move_to_end(telegram_id)
+        while len(cache) > self.HOT_USERS:
+            cache.popitem(last=False)
+
+    def _forget(
+        self, telegram_id: int, accounts: bool = True, positions: bool = True
+    ) -> None:
+        if accounts:
+            self._hot_accounts.pop(telegram_id, None)
+        if positions:
+            self._hot_positions.pop(telegram_id, None)
+
+    def hot_state(self) -> Dict[str, Any]:
+        """Active users' accounts and positions, for the warm-state snapshot."""
+        # The dust sweep may evict entries from a worker thread, so copy first
+        return {
+            "accounts": list(self._hot_accounts.values()),
+            "positions": {
+                str(telegram_id): rows
+                for telegram_id, rows in list(self._hot_positions.items())
+            },
+        }
+
+    def restore_hot_state(self, state: Dict[str, Any]) -> None:
+        for row in state["accounts"]:
+            self._remember(self._hot_accounts, row["telegram_id"], row)
+        for telegram_id, rows in state["positions"].items():
+            self._remember(self._hot_positions, int(telegram_id), rows)
 
     def get_account(self, telegram_id: int) -> Optional[Account]:
+        row = self._hot_accounts.get(telegram_id)
+        if row is not None:
+            self._hot_accounts.move_to_end(telegram_id)
+            return Account(**row)
+
         with Session(self.engine) as session:
             statement = select(Account).where(Account.telegram_id == telegram_id)
-            return session.exec(statement).first()
+            account = session.exec(statement).first()
+            if account:
+                self._remember(self._hot_accounts, telegram_id, account.model_dump())
+            return account
 
     def get_positions(self, telegram_id: int) -> List[Position]:
+        rows = self._hot_positions.get(telegram_id)
+        if rows is not None:
+            self._hot_positions.move_to_end(telegram_id)
+            return [Position(**row) for row in rows]
+
         with Session(self.engine) as session:
             statement = select(Position).where(Position.telegram_id == telegram_id)
-            return session.exec(statement).all()
+            positions = session.exec(statement).all()
+            self._remember(
+                self._hot_positions,
+                telegram_id,
+                [position.model_dump() for position in positions],
+            )
+            return positions
 
     def get_position(self, telegram_id: int, token_address: str) -> Optional[Position]:
         """Get a specific position for a user and token."""
+        rows = self._hot_positions.get(telegram_id)
+        if rows is not None:
+            self._hot_positions.move_to_end(telegram_id)
+            for row in rows:
+                if row["token_address"] == token_address:
+                    return Position(**row)
+            return None
+
         with Session(self.engine) as session:
             statement = select(Position).where(
                 Position.telegram_id == telegram_id,
@@ -32,15 +211,17 @@ class Database:
             )
             return session.exec(statement).first()
 
-    def create_account(self, telegram_id: int, initial_balance: float) -> Account:
+    def create_account(self, telegram_id: int, lamports: int) -> Account:
+        self._forget(telegram_id, positions=False)
         with Session(self.engine) as session:
-            account = Account(telegram_id=telegram_id, sol_balance=initial_balance)
+            account = Account(telegram_id=telegram_id, lamports=lamports)
             session.add(account)
             session.commit()
             session.refresh(account)
             return account
 
-    def reset_account(self, telegram_id: int, new_balance: float) -> Account:
+    def reset_account(self, telegram_id: int, lamports: int) -> Account:
+        self._forget(telegram_id)
         with Session(self.engine) as session:
             # Delete all positions
             statement = select(Position).where(Position.telegram_id == telegram_id)
@@ -54,9 +235,9 @@ class Database:
             ).first()
 
             if account:
-                account.sol_balance = new_balance
+                account.lamports = lamports
             else:
-                account = Account(telegram_id=telegram_id, sol_balance=new_balance)
+                account = Account(telegram_id=telegram_id, lamports=lamports)
                 session.add(account)
 
             session.commit()
@@ -65,26 +246,30 @@ class Database:
 
     def update_account(self, account: Account) -> None:
         """Update account information."""
+        self._forget(account.telegram_id, positions=False)
         with Session(self.engine) as session:
-            session.add(account)
+            # merge rather than add: cached reads hand out transient instances
+            session.merge(account)
             session.commit()
-            session.refresh(account)
 
     def create_position(
         self,
         telegram_id: int,
         token_address: str,
-        quantity: float,
-        entry_price: float,
+        quantity: int,
+        decimals: int,
+        cost_lamports: int,
         entry_mcap: float,
     ) -> Position:
         """Create a new position."""
+        self._forget(telegram_id, accounts=False)
         with Session(self.engine) as session:
             position = Position(
                 telegram_id=telegram_id,
                 token_address=token_address,
                 quantity=quantity,
-                entry_price=entry_price,
+                decimals=decimals,
+                cost_lamports=cost_lamports,
                 entry_mcap=entry_mcap,
             )
             session.add(position)
@@ -96,11 +281,13 @@ class Database:
         self,
         telegram_id: int,
         token_address: str,
-        quantity: float,
-        entry_price: float,
+        quantity: int,
+        decimals: int,
+        cost_lamports: int,
         entry_mcap: float,
     ) -> Position:
         """Update an existing position."""
+        self._forget(telegram_id, accounts=False)
         with Session(self.engine) as session:
             statement = select(Position).where(
                 Position.telegram_id == telegram_id,
@@ -110,18 +297,25 @@ class Database:
 
             if position:
                 position.quantity = quantity
-                position.entry_price = entry_price
+                position.cost_lamports = cost_lamports
+                position.entry_mcap = entry_mcap
                 session.add(position)
                 session.commit()
                 session.refresh(position)
                 return position
             else:
                 return self.create_position(
-                    telegram_id, token_address, quantity, entry_price, entry_mcap
+                    telegram_id,
+                    token_address,
+                    quantity,
+                    decimals,
+                    cost_lamports,
+                    entry_mcap,
                 )
 
     def delete_position(self, telegram_id: int, token_address: str) -> bool:
         """Delete a position. Returns True if position was deleted."""
+        self._forget(telegram_id, accounts=False)
         with Session(self.engine) as session:
             statement = select(Position).where(
                 Position.telegram_id == telegram_id,
@@ -136,31 +330,110 @@ class Database:
             return False
 
     def upsert_position(
-        self, telegram_id: int, token_address: str, quantity: float, entry_price: float
+        self,
+        telegram_id: int,
+        token_address: str,
+        quantity: int,
+        decimals: int,
+        cost_lamports: int,
+        entry_mcap: float,
     ) -> Position:
         """Create or update a position based on whether it exists."""
         existing_position = self.get_position(telegram_id, token_address)
 
         if existing_position:
-            # Calculate new average entry price
-            total_cost = (
-                existing_position.quantity * existing_position.entry_price
-            ) + (quantity * entry_price)
             total_quantity = existing_position.quantity + quantity
-            new_entry_price = (
-                total_cost / total_quantity if total_quantity > 0 else entry_price
-            )
+            new_entry_mcap = (
+                existing_position.entry_mcap * existing_position.quantity
+                + entry_mcap * quantity
+            ) / total_quantity
 
             return self.update_position(
                 telegram_id=telegram_id,
                 token_address=token_address,
                 quantity=total_quantity,
-                entry_price=new_entry_price,
+                decimals=existing_position.decimals,
+                cost_lamports=existing_position.cost_lamports + cost_lamports,
+                entry_mcap=new_entry_mcap,
             )
         else:
             return self.create_position(
                 telegram_id=telegram_id,
                 token_address=token_address,
                 quantity=quantity,
-                entry_price=entry_price,
+                decimals=decimals,
+                cost_lamports=cost_lamports,
+                entry_mcap=entry_mcap,
+            )
+
+    def compact_dust_positions(self, prices_native: Dict[str, float]) -> int:
+        """Delete empty positions and those worth less than one lamport at the
+        given SOL-per-token prices. Positions in tokens without a price are
+        only removed if empty. Returns the number removed."""
+        with Session(self.engine) as session:
+            removed = 0
+            for position in session.exec(select(Position)).all():
+                price_native = prices_native.get(position.token_address)
+                if position.quantity > 0 and (
+                    price_native is None
+                    or lamports_for_tokens(
+                        position.quantity, price_native, position.decimals
+                    )
+                    >= 1
+                ):
+                    continue
+
+                self._forget(position.telegram_id, accounts=False)
+                session.delete(position)
+                removed += 1
+            session.commit()
+            return removed
+
+    def create_alert(
+        self, telegram_id: int, token_address: str, direction: str, price: float
+    ) -> Alert:
+        """Create a new armed price alert."""
+        with Session(self.engine) as session:
+            alert = Alert(
+                telegram_id=telegram_id,
+                token_address=token_address,
+                direction=direction,
+                price=price,
+            )
+            session.add(alert)
+            session.commit()
+            session.refresh(alert)
+            return alert
+
+    def get_alerts(self, telegram_id: int) -> List[Alert]:
+        with Session(self.engine) as session:
+            statement = select(Alert).where(Alert.telegram_id == telegram_id)
+            return session.exec(statement).all()
+
+    def get_all_alerts(self) -> List[Alert]:
+        with Session(self.engine) as session:
+            return session.exec(select(Alert)).all()
+
+    def delete_alert(self, telegram_id: int, alert_id: int) -> Optional[Alert]:
+        """Delete a user's alert. Returns the deleted alert, if any."""
+        with Session(self.engine) as session:
+            statement = select(Alert).where(
+                Alert.id == alert_id, Alert.telegram_id == telegram_id
             )
+            alert = session.exec(statement).first()
+
+            if alert:
+                session.delete(alert)
+                session.commit()
+            return alert
+
+    def set_alerts_fired(self, alert_ids: List[int], fired: bool) -> None:
+        """Persist the fired/re-armed state of a batch of alerts."""
+        if not alert_ids:
+            return
+        with Session(self.engine) as session:
+            statement = select(Alert).where(Alert.id.in_(alert_ids))
+            for alert in session.exec(statement).all():
+                alert.fired = fired
+                session.add(alert)
+            session.commit()
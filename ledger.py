@@ -0,0 +1,73 @@
+"""Exact integer arithmetic for SOL balances and token quantities.
+
+Balances are held in lamports and token quantities in base units (the token
+amount scaled by 10 ** decimals). Prices come from DexScreener as decimals
+and are converted to exact fractions, so every trade rounds down exactly once.
+"""
+
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from typing import Sequence, Union
+
+LAMPORTS_PER_SOL = 10**9
+
+# Largest balance or quantity an int64 column (and int64 array) can hold
+MAX_AMOUNT = 2**63 - 1
+
+# Used when a token's decimals can't be looked up, and for positions that
+# predate per-token decimals. Most SPL memecoins use 6.
+DEFAULT_TOKEN_DECIMALS = 6
+
+
+def sol_to_lamports(sol: Union[str, float]) -> int:
+    """Parse a SOL amount, rounding down to whole lamports."""
+    try:
+        amount = Decimal(str(sol))
+    except InvalidOperation:
+        raise ValueError(f"Invalid SOL amount: {sol}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid SOL amount: {sol}")
+    return int(amount * LAMPORTS_PER_SOL)
+
+
+def lamports_to_sol(lamports: int) -> float:
+    return lamports / LAMPORTS_PER_SOL
+
+
+def base_units_to_tokens(base_units: int, decimals: int) -> float:
+    return base_units / 10**decimals
+
+
+def portion(amount: int, percentage: Union[str, float]) -> int:
+    """The given percentage of an integer amount, rounded down. 100% is exact."""
+    return int(amount * Fraction(str(percentage)) / 100)
+
+
+def tokens_for_lamports(lamports: int, price_native: float, decimals: int) -> int:
+    """Base units bought with `lamports` at `price_native` SOL per token."""
+    return int(
+        lamports * 10**decimals / (Fraction(str(price_native)) * LAMPORTS_PER_SOL)
+    )
+
+
+def lamports_for_tokens(base_units: int, price_native: float, decimals: int) -> int:
+    """Lamports received for `base_units` at `price_native` SOL per token."""
+    return int(
+        base_units * Fraction(str(price_native)) * LAMPORTS_PER_SOL / 10**decimals
+    )
+
+
+def price_per_base_unit(price_native: float, decimals: int) -> float:
+    """Lamports per base unit, the price scale used by portfolio_value."""
+    return price_native * LAMPORTS_PER_SOL / 10**decimals
+
+
+def portfolio_value(
+    quantities: Sequence[int], prices_per_base_unit: Sequence[float]
+) -> int:
+    """Total value in lamports of int64 quantities at per-base-unit prices.
+
+    Both inputs are flat numeric columns, so this is a plain dot product and
+    can be handed to numpy as int64/float64 arrays unchanged.
+    """
+    return int(sum(q * p for q, p in zip(quantities, prices_per_base_unit)))
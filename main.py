@@ -1,8 +1,12 @@
+from alerts import AlertService
 from callback import CallbackHandlers
 from commands import CommandHandlers
 from db import Database
 from dotenv import dotenv_values
+from services import DexScreenerAPI, DustSweeper, SolanaRPC
+from snapshot import load_snapshot, save_snapshot
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+from telegram_tracing import SlowUpdateTracer, TracedApplication, TracedRequest
 
 
 config = dotenv_values(".env")
@@ -12,11 +16,69 @@ def main() -> None:
     # Initialize services
     db = Database()
 
+    dex_api = DexScreenerAPI()
+    solana_rpc = SolanaRPC(
+        config.get("SOLANA_RPC_URL") or SolanaRPC.DEFAULT_URL,
+        token_metadata=dex_api.token_metadata,
+    )
+    alert_service = AlertService(
+        db, dex_api, interval=float(config.get("ALERT_INTERVAL") or 30)
+    )
+
+    dust_sweeper = DustSweeper(
+        db, dex_api, interval=float(config.get("DUST_SWEEP_INTERVAL") or 3600)
+    )
+
+    # Start warm: recent prices, token metadata and active users' rows
+    snapshot_path = config.get("SNAPSHOT_PATH") or "warm_state.json"
+    load_snapshot(snapshot_path, db, dex_api)
+
     # Initialize handlers
-    command_handlers = CommandHandlers(db)
-    callback_handlers = CallbackHandlers(db)
+    debug_dir = config.get("DEBUG_DIR") or "debug"
+    command_handlers = CommandHandlers(
+        db,
+        dex_api,
+        alert_service,
+        admin_ids=[
+            int(admin_id)
+            for admin_id in (config.get("ADMIN_IDS") or "").split(",")
+            if admin_id.strip()
+        ],
+        profiling_enabled=config.get("PROFILING") == "1",
+        debug_dir=debug_dir,
+    )
+    callback_handlers = CallbackHandlers(db, dex_api, solana_rpc)
+
+    async def post_init(application: Application) -> None:
+        alert_service.start(application.bot)
+        dust_sweeper.start()
 
-    application = Application.builder().token(config["API"]).build()
+    async def post_shutdown(application: Application) -> None:
+        await alert_service.stop()
+        await dust_sweeper.stop()
+        dex_api.shutdown()
+        save_snapshot(snapshot_path, db, dex_api)
+
+    builder = (
+        Application.builder()
+        .token(config["API"])
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+
+    # Trace Database, DexScreener and Telegram calls of updates slower than this
+    if config.get("SLOW_UPDATE_MS"):
+        builder = builder.request(TracedRequest()).application_class(
+            TracedApplication,
+            kwargs={
+                "slow_update_tracer": SlowUpdateTracer(
+                    float(config["SLOW_UPDATE_MS"]),
+                    path=f"{debug_dir}/slow_updates.log",
+                )
+            },
+        )
+
+    application = builder.build()
 
     # Add other command handlers
     application.add_handler(
@@ -25,6 +87,11 @@ def main() -> None:
     application.add_handler(
         CallbackQueryHandler(callback_handlers.handle_sell_callback, pattern="^sell_")
     )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback_handlers.handle_portfolio_callback, pattern="^portfolio_"
+        )
+    )
 
     application.add_handler(CommandHandler("start", command_handlers.start))
     application.add_handler(CommandHandler("reload", command_handlers.reload))
@@ -32,6 +99,12 @@ def main() -> None:
     application.add_handler(CommandHandler("help", command_handlers.help))
     application.add_handler(CommandHandler("buy", command_handlers.buy))
     application.add_handler(CommandHandler("sell", command_handlers.sell))
+    application.add_handler(CommandHandler("watch", command_handlers.watch))
+    application.add_handler(CommandHandler("alerts", command_handlers.alerts))
+    application.add_handler(CommandHandler("unwatch", command_handlers.unwatch))
+    application.add_handler(
+        CommandHandler("debug", command_handlers.debug, block=False)
+    )
     application.run_polling()
 
 
@@ -1,17 +1,43 @@
 from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime
+from ledger import LAMPORTS_PER_SOL, base_units_to_tokens, lamports_to_sol
 
 
 class Account(SQLModel, table=True):
     telegram_id: int = Field(primary_key=True)
-    sol_balance: float
+    lamports: int
+
+    @property
+    def sol_balance(self) -> float:
+        return lamports_to_sol(self.lamports)
 
 
 class Position(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     telegram_id: int = Field(foreign_key="account.telegram_id")
     token_address: str
-    quantity: float
-    entry_price: float
+    quantity: int  # base units
+    decimals: int
+    cost_lamports: int  # total cost basis of the open quantity
     entry_mcap: float
+
+    @property
+    def token_quantity(self) -> float:
+        return base_units_to_tokens(self.quantity, self.decimals)
+
+    @property
+    def entry_price(self) -> float:
+        """Average entry price in SOL per token."""
+        if not self.quantity:
+            return 0.0
+        return (self.cost_lamports / LAMPORTS_PER_SOL) / self.token_quantity
+
+
+class Alert(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    telegram_id: int = Field(foreign_key="account.telegram_id")
+    token_address: str = Field(index=True)
+    direction: str  # "above" or "below"
+    price: float  # threshold in USD
+    fired: bool = False
@@ -0,0 +1,37 @@
+"""Inline keyboard and edit tracking shared by the /portfolio command and its
+page buttons."""
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Portfolio messages per chat whose last rendered text is remembered
+TRACKED_PORTFOLIO_MESSAGES = 20
+
+
+def portfolio_keyboard(owner_id: int, page: int, pages: int) -> InlineKeyboardMarkup:
+    """Page navigation for a portfolio message; only its owner may use it."""
+    buttons = []
+    if page > 0:
+        buttons.append(
+            InlineKeyboardButton(
+                "« Prev", callback_data=f"portfolio_{owner_id}_{page - 1}"
+            )
+        )
+    buttons.append(
+        InlineKeyboardButton("🔄 Refresh", callback_data=f"portfolio_{owner_id}_{page}")
+    )
+    if page < pages - 1:
+        buttons.append(
+            InlineKeyboardButton(
+                "Next »", callback_data=f"portfolio_{owner_id}_{page + 1}"
+            )
+        )
+    return InlineKeyboardMarkup([buttons])
+
+
+def remember_portfolio_render(chat_data: dict, message_id: int, summary: str) -> None:
+    """Record what a portfolio message shows, so unchanged edits can be skipped."""
+    renders = chat_data.setdefault("portfolio_renders", {})
+    renders.pop(message_id, None)
+    renders[message_id] = summary
+    while len(renders) > TRACKED_PORTFOLIO_MESSAGES:
+        del renders[next(iter(renders))]
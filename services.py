@@ -1,15 +1,44 @@
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import requests
 from db import Database
+from ledger import (
+    DEFAULT_TOKEN_DECIMALS,
+    lamports_to_sol,
+    portfolio_value,
+    price_per_base_unit,
+)
 from models import Account, Position
+from tracing import traced_methods
 
 logger = logging.getLogger(__name__)
 
 
+@traced_methods("dexscreener")
 class DexScreenerAPI:
     BASE_URL = "https://api.dexscreener.com/latest/dex/tokens"
+    # Addresses the tokens endpoint accepts in one comma-separated request
+    MAX_BATCH = 30
+    # How stale a cached price may be for display purposes
+    PRICE_TTL = 30.0
+    # How old a price restored from the warm-state snapshot may be. Such a
+    # price is served while a fresh one is fetched in the background.
+    RESTORE_WINDOW = 15 * 60.0
+
+    def __init__(self):
+        # token address -> (fetched at, token data)
+        self.prices: Dict[str, Tuple[float, Tuple[str, float, float, float]]] = {}
+        # token address -> static metadata such as the symbol
+        self.token_metadata: Dict[str, Dict[str, Any]] = {}
+        # Prices from the last run, read lazily (see snapshot.PriceTable)
+        self.restored_prices = None
+        self._refreshing: Set[str] = set()
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
 
     @staticmethod
     def _get_best_pair(pairs: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
@@ -20,9 +49,22 @@ class DexScreenerAPI:
         return max(pairs, key=lambda x: x.get("liquidity", {}).get("usd", 0))
 
     def get_token_data(
-        self, token_address: str
+        self, token_address: str, max_age: float = 0
     ) -> Optional[Tuple[str, float, float, float]]:
-        """Fetch token data from DexScreener API."""
+        """Fetch token data from DexScreener API.
+
+        With max_age > 0, a cached result at most that many seconds old is
+        returned instead of hitting the API.
+        """
+        if max_age > 0:
+            cached = self.prices.get(token_address)
+            if cached and time.time() - cached[0] <= max_age:
+                return cached[1]
+            if cached is None:
+                restored = self._get_restored(token_address)
+                if restored:
+                    return restored
+
         try:
             response = requests.get(
                 f"{self.BASE_URL}/{token_address}", headers={}, timeout=10
@@ -36,12 +78,7 @@ class DexScreenerAPI:
                 logger.warning(f"No pairs found for token {token_address}")
                 return None
 
-            return (
-                best_pair.get("baseToken")["symbol"],
-                float(best_pair.get("priceNative")),
-                float(best_pair.get("priceUsd")),
-                float(str(best_pair.get("marketCap"))),
-            )
+            return self._cache_pair(token_address, best_pair)
         except requests.RequestException as e:
             logger.error(f"Error fetching token data: {e}")
             return None
@@ -49,32 +86,263 @@ class DexScreenerAPI:
             logger.error(f"Error parsing token data: {e}")
             return None
 
+    def get_tokens_data(
+        self, token_addresses: List[str]
+    ) -> Dict[str, Tuple[str, float, float, float]]:
+        """Fetch fresh data for many tokens, MAX_BATCH addresses per request.
+
+        Tokens without pairs, or whose request failed, are left out.
+        """
+        results: Dict[str, Tuple[str, float, float, float]] = {}
+        for i in range(0, len(token_addresses), self.MAX_BATCH):
+            batch = token_addresses[i : i + self.MAX_BATCH]
+            try:
+                response = requests.get(
+                    f"{self.BASE_URL}/{','.join(batch)}", headers={}, timeout=10
+                )
+                response.raise_for_status()
+                pairs = response.json().get("pairs") or []
+            except requests.RequestException as e:
+                logger.error(f"Error fetching token data: {e}")
+                continue
+            except ValueError as e:
+                logger.error(f"Error parsing token data: {e}")
+                continue
+
+            pairs_by_token: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for pair in pairs:
+                pairs_by_token[pair.get("baseToken", {}).get("address")].append(pair)
+
+            for token_address in batch:
+                best_pair = self._get_best_pair(pairs_by_token.get(token_address, []))
+                if not best_pair:
+                    logger.warning(f"No pairs found for token {token_address}")
+                    continue
+                try:
+                    results[token_address] = self._cache_pair(token_address, best_pair)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.error(f"Error parsing token data: {e}")
+        return results
+
+    def _cache_pair(
+        self, token_address: str, pair: Dict[str, Any]
+    ) -> Tuple[str, float, float, float]:
+        token_data = (
+            pair.get("baseToken")["symbol"],
+            float(pair.get("priceNative")),
+            float(pair.get("priceUsd")),
+            float(str(pair.get("marketCap"))),
+        )
+        self.prices[token_address] = (time.time(), token_data)
+        self.token_metadata.setdefault(token_address, {})["symbol"] = token_data[0]
+        return token_data
+
+    def _get_restored(
+        self, token_address: str
+    ) -> Optional[Tuple[str, float, float, float]]:
+        """A price from the previous run, refreshed in the background when used."""
+        if self.restored_prices is None:
+            return None
+
+        restored = self.restored_prices.get(token_address)
+        if not restored or time.time() - restored[0] > self.RESTORE_WINDOW:
+            return None
+
+        if token_address not in self._refreshing:
+            self._refreshing.add(token_address)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix="price-refresh"
+                )
+            future = self._refresh_executor.submit(self.get_token_data, token_address)
+            future.add_done_callback(lambda _: self._refreshing.discard(token_address))
+        return restored[1]
+
+    def recent_prices(
+        self,
+    ) -> Dict[str, Tuple[float, Tuple[str, float, float, float]]]:
+        """Prices young enough to be worth restoring after a restart."""
+        now = time.time()
+        # Background refreshes and alert ticks write the caches from worker
+        # threads, so iterate over copies
+        return {
+            token_address: cached
+            for token_address, cached in list(self.prices.items())
+            if now - cached[0] <= self.RESTORE_WINDOW
+        }
+
+    def hot_state(self) -> Dict[str, Any]:
+        """Token metadata, for the warm-state snapshot."""
+        return {
+            "token_metadata": {
+                token_address: dict(metadata)
+                for token_address, metadata in list(self.token_metadata.items())
+            }
+        }
+
+    def restore_hot_state(self, state: Dict[str, Any]) -> None:
+        self.token_metadata.update(state["token_metadata"])
+
+    def shutdown(self) -> None:
+        """Wait for background price refreshes, so none outlive the snapshot."""
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown(cancel_futures=True)
+            self._refresh_executor = None
+
+
+@traced_methods("solana")
+class SolanaRPC:
+    DEFAULT_URL = "https://api.mainnet-beta.solana.com"
+
+    def __init__(
+        self,
+        url: str = DEFAULT_URL,
+        token_metadata: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.url = url
+        # Shared with DexScreenerAPI so decimals land in the same registry
+        self.token_metadata = token_metadata if token_metadata is not None else {}
+
+    def get_token_decimals(self, token_address: str) -> int:
+        """Decimals of an SPL token, falling back to DEFAULT_TOKEN_DECIMALS."""
+        metadata = self.token_metadata.get(token_address, {})
+        if "decimals" in metadata:
+            return metadata["decimals"]
+
+        try:
+            response = requests.post(
+                self.url,
+                json={
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "getTokenSupply",
+                    "params": [token_address],
+                },
+                timeout=10,
+            )
+            response.raise_for_status()
+            decimals = int(response.json()["result"]["value"]["decimals"])
+        except requests.RequestException as e:
+            logger.error(f"Error fetching token decimals: {e}")
+            return DEFAULT_TOKEN_DECIMALS
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing token decimals: {e}")
+            return DEFAULT_TOKEN_DECIMALS
+
+        self.token_metadata.setdefault(token_address, {})["decimals"] = decimals
+        return decimals
+
+
+class DustSweeper:
+    """Periodically deletes positions worth less than one lamport."""
+
+    def __init__(
+        self, db: Database, dexscreener: DexScreenerAPI, interval: float = 3600.0
+    ):
+        self.db = db
+        self.dexscreener = dexscreener
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def sweep(self) -> int:
+        # Only tokens with a reasonably recent price can be judged by value
+        recent_prices = self.dexscreener.recent_prices()
+        prices_native = {
+            token_address: token_data[1]
+            for token_address, (_, token_data) in recent_prices.items()
+        }
+        removed = self.db.compact_dust_positions(prices_native)
+        if removed:
+            logger.info(f"Removed {removed} dust positions")
+        return removed
+
+    async def run(self) -> None:
+        while True:
+            # Wait first: at startup there are no recent prices to judge by,
+            # and the scan would compete with the first updates
+            await asyncio.sleep(self.interval)
+            try:
+                # Scans every position, so keep it off the event loop
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Error sweeping dust positions: {e}")
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
 
 class PortfolioService:
+    # Keeps a page well inside Telegram's 4096 character message limit
+    PAGE_SIZE = 5
+
     def __init__(self, db: Database, dexscreener: DexScreenerAPI):
         self.db = db
         self.dexscreener = dexscreener
 
-    def get_portfolio_summary(self, account: Account, positions: List[Position]) -> str:
+    def get_portfolio_page(
+        self, account: Account, positions: List[Position], page: int = 0
+    ) -> Tuple[str, int, int]:
+        """Render one page of the portfolio. Only that page's positions are priced.
+
+        Returns the text, the page actually rendered (clamped to the valid
+        range) and the number of pages.
+        """
+        pages = max(1, -(-len(positions) // self.PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+
         summary = f"Balance: {account.sol_balance:,.2f} SOL\n\nPositions:\n"
 
         if not positions:
             summary += "No open positions"
-            return summary
+            return summary, page, pages
+
+        visible = sorted(positions, key=lambda position: position.id)[
+            page * self.PAGE_SIZE : (page + 1) * self.PAGE_SIZE
+        ]
 
-        for position in positions:
-            symbol, token_price_sol, token_price_usd, market_cap = (
-                self.dexscreener.get_token_data(position.token_address)
+        quantities = []
+        prices = []
+        for position in visible:
+            token_info = self.dexscreener.get_token_data(
+                position.token_address, max_age=self.dexscreener.PRICE_TTL
             )
+            token_quantity = position.token_quantity
+
+            if not token_info:
+                summary += (
+                    f"`{position.token_address}`\n"
+                    f"  Quantity: {token_quantity}\n"
+                    f"  Average Entry Price: $XX ({position.entry_price:,.2f} SOL)\n"
+                    f"  Current Price: unavailable\n\n"
+                )
+                continue
+
+            symbol, token_price_sol, token_price_usd, market_cap = token_info
+            quantities.append(position.quantity)
+            prices.append(price_per_base_unit(token_price_sol, position.decimals))
 
             summary += (
                 f"{symbol}:\n"
                 f" `{position.token_address}`\n"
-                f"  Quantity: {position.quantity}\n"
-                f"  Current Position Size: ${position.quantity * token_price_usd:,.2f} ({position.quantity * token_price_sol:,.2f} SOL)\n"
+                f"  Quantity: {token_quantity}\n"
+                f"  Current Position Size: ${token_quantity * token_price_usd:,.2f} ({token_quantity * token_price_sol:,.2f} SOL)\n"
                 f"  Average Entry Price: $XX ({position.entry_price:,.2f} SOL)\n"
                 f"  Current Price : ${token_price_usd:,.2f} ({token_price_sol:,.2f} SOL)\n"
                 f"  Current Market Cap: ${market_cap:,.0f}\n\n"
             )
 
-        return summary
+        total = portfolio_value(quantities, prices)
+        summary += (
+            f"Page Position Value: {lamports_to_sol(total):,.2f} SOL\n"
+            f"Page {page + 1}/{pages}"
+        )
+        return summary, page, pages
@@ -0,0 +1,187 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+from db import SCHEMA_VERSION, Database
+from services import DexScreenerAPI
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+_PRICE_MAGIC = b"PRICES01"
+# magic, record count
+_PRICE_HEADER = struct.Struct("<8sI")
+# token address, symbol, fetched at, price native, price usd, market cap
+_PRICE_RECORD = struct.Struct("<64s32sdddd")
+_ADDRESS_SIZE = 64
+
+TokenData = Tuple[str, float, float, float]
+
+
+class PriceTable:
+    """Fixed-size price records sorted by token address.
+
+    The file is memory-mapped and looked up by binary search in place, so
+    startup does not parse it at all; only the pages holding the probed
+    records are ever read.
+    """
+
+    def __init__(self, mm: mmap.mmap):
+        if len(mm) < _PRICE_HEADER.size:
+            raise ValueError("Price table is truncated")
+        magic, self._count = _PRICE_HEADER.unpack_from(mm, 0)
+        if magic != _PRICE_MAGIC:
+            raise ValueError("Not a price table")
+        if len(mm) != _PRICE_HEADER.size + self._count * _PRICE_RECORD.size:
+            raise ValueError("Price table is truncated")
+        self._mm = mm
+
+    @classmethod
+    def open(cls, path: str) -> "PriceTable":
+        with open(path, "rb") as f:
+            # The mapping stays valid after the file is closed
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mm)
+        except ValueError:
+            mm.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _offset(self, i: int) -> int:
+        return _PRICE_HEADER.size + i * _PRICE_RECORD.size
+
+    def get(self, token_address: str) -> Optional[Tuple[float, TokenData]]:
+        key = token_address.encode()
+        if len(key) > _ADDRESS_SIZE:
+            return None
+        key = key.ljust(_ADDRESS_SIZE, b"\0")
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = self._offset(mid)
+            if self._mm[offset : offset + _ADDRESS_SIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self._count:
+            return None
+        offset = self._offset(lo)
+        if self._mm[offset : offset + _ADDRESS_SIZE] != key:
+            return None
+
+        _, symbol, fetched_at, price_native, price_usd, market_cap = (
+            _PRICE_RECORD.unpack_from(self._mm, offset)
+        )
+        return fetched_at, (
+            symbol.rstrip(b"\0").decode(errors="ignore"),
+            price_native,
+            price_usd,
+            market_cap,
+        )
+
+    def close(self) -> None:
+        self._mm.close()
+
+    @staticmethod
+    def write(path: str, prices: Dict[str, Tuple[float, TokenData]]) -> None:
+        records = sorted(
+            (token_address.encode().ljust(_ADDRESS_SIZE, b"\0"), cached)
+            for token_address, cached in prices.items()
+            if len(token_address.encode()) <= _ADDRESS_SIZE
+        )
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_PRICE_HEADER.pack(_PRICE_MAGIC, len(records)))
+            for key, (fetched_at, token_data) in records:
+                symbol, price_native, price_usd, market_cap = token_data
+                f.write(
+                    _PRICE_RECORD.pack(
+                        key,
+                        symbol.encode(),
+                        fetched_at,
+                        price_native,
+                        price_usd,
+                        market_cap,
+                    )
+                )
+        os.replace(tmp_path, path)
+
+
+def save_snapshot(path: str, db: Database, dexscreener: DexScreenerAPI) -> None:
+    """Persist hot in-memory state so the next start does not begin cold.
+
+    Prices go to a memory-mapped table next to `path`; the remaining state is
+    small and stored as JSON.
+    """
+    PriceTable.write(f"{path}.prices", dexscreener.recent_prices())
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "db_stamp": db.file_stamp(),
+        "dexscreener": dexscreener.hot_state(),
+        "db": db.hot_state(),
+    }
+
+    # Write then rename so a crash never leaves a truncated snapshot behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    logger.info(f"Saved warm-state snapshot to {path}")
+
+
+def load_snapshot(path: str, db: Database, dexscreener: DexScreenerAPI) -> bool:
+    """Restore hot state saved by save_snapshot. Returns True if anything was
+    restored; a missing, unreadable or incompatible snapshot is ignored."""
+    restored = False
+
+    try:
+        dexscreener.restored_prices = PriceTable.open(f"{path}.prices")
+        restored = True
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable price table {path}.prices: {e}")
+
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return restored
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return restored
+
+    try:
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring snapshot {path} with unknown version")
+            return restored
+
+        dexscreener.restore_hot_state(snapshot["dexscreener"])
+
+        # Account rows are only trusted if the database is exactly as we left it
+        if (
+            snapshot["schema_version"] == SCHEMA_VERSION
+            and snapshot["db_stamp"] is not None
+            and snapshot["db_stamp"] == db.file_stamp()
+        ):
+            db.restore_hot_state(snapshot["db"])
+        else:
+            logger.info("Database changed since snapshot, not restoring accounts")
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Ignoring malformed snapshot {path}: {e}")
+        return restored
+
+    logger.info(f"Restored warm-state snapshot from {path}")
+    return True
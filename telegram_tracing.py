@@ -0,0 +1,96 @@
+"""Telegram-bound tracing: only main.py imports this module."""
+
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List
+
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+from tracing import current_trace, span
+
+logger = logging.getLogger(__name__)
+
+
+class TracedRequest(HTTPXRequest):
+    """Bot API request backend that records each Telegram call as a span."""
+
+    def __init__(self, connection_pool_size: int = 256, **kwargs):
+        # HTTPXRequest defaults to a single connection; match the pool the
+        # ApplicationBuilder gives the request backend this one replaces
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with span("telegram", url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+class SlowUpdateTracer:
+    """Writes the span trace of every update slower than a threshold."""
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        path: str = "debug/slow_updates.log",
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        self.threshold_ms = threshold_ms
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.logger = logging.getLogger(f"{__name__}.slow_updates")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        # The logger is module-global; don't stack a handler per instance
+        if not self.logger.handlers:
+            self.logger.addHandler(
+                RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            )
+
+    def record(self, update: object, started: float, spans: List[Dict]) -> None:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        self.logger.info(
+            json.dumps(
+                {
+                    "time": time.time(),
+                    "update_id": getattr(update, "update_id", None),
+                    "duration_ms": round(duration_ms, 3),
+                    "spans": [
+                        {
+                            "kind": s["kind"],
+                            "name": s["name"],
+                            "offset_ms": round((s["start"] - started) * 1000, 3),
+                            "duration_ms": round(s["duration_ms"], 3),
+                            "error": s["error"],
+                        }
+                        for s in sorted(spans, key=lambda s: s["start"])
+                    ],
+                }
+            )
+        )
+        logger.warning(
+            f"Slow update {getattr(update, 'update_id', None)}: {duration_ms:.0f}ms"
+        )
+
+
+class TracedApplication(Application):
+    """Application that traces each update and hands it to a SlowUpdateTracer."""
+
+    def __init__(self, *, slow_update_tracer: SlowUpdateTracer, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_update_tracer = slow_update_tracer
+
+    async def process_update(self, update: object) -> None:
+        spans: List[Dict[str, Any]] = []
+        token = current_trace.set(spans)
+        started = time.perf_counter()
+        try:
+            await super().process_update(update)
+        finally:
+            current_trace.reset(token)
+            self.slow_update_tracer.record(update, started, spans)
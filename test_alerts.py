@@ -0,0 +1,51 @@
+from alerts import ABOVE, BELOW, TokenAlerts
+from models import Alert
+
+
+def make_alerts(*specs):
+    token_alerts = TokenAlerts()
+    for alert_id, (direction, price) in enumerate(specs, start=1):
+        token_alerts.add(
+            Alert(
+                id=alert_id,
+                telegram_id=alert_id,
+                token_address="T",
+                direction=direction,
+                price=price,
+            )
+        )
+    return token_alerts
+
+
+def test_evaluate_fires_only_crossed_alerts():
+    token_alerts = make_alerts(
+        (ABOVE, 2.0), (ABOVE, 1.0), (ABOVE, 0.5), (BELOW, 0.5), (BELOW, 1.5)
+    )
+
+    fired, rearmed = token_alerts.evaluate(1.0)
+
+    assert sorted(fired) == [2, 3, 5]
+    assert rearmed == []
+    assert len(token_alerts) == 5
+
+
+def test_fired_alerts_stay_quiet_until_price_crosses_back():
+    token_alerts = make_alerts((ABOVE, 2.0), (BELOW, 1.0))
+
+    assert token_alerts.evaluate(2.5) == ([1], [])
+    # Still above: nothing fires again
+    assert token_alerts.evaluate(3.0) == ([], [])
+
+    # Back below re-arms the above alert and fires the below one
+    assert token_alerts.evaluate(0.5) == ([2], [1])
+    assert token_alerts.evaluate(2.0) == ([1], [2])
+
+
+def test_removed_alerts_no_longer_fire():
+    token_alerts = make_alerts((ABOVE, 1.0), (ABOVE, 1.0))
+    token_alerts.remove(
+        Alert(id=1, telegram_id=1, token_address="T", direction=ABOVE, price=1.0)
+    )
+
+    assert token_alerts.evaluate(1.5) == ([2], [])
+    assert len(token_alerts) == 1
@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+import db
+from db import SCHEMA_VERSION, Database
+from ledger import LAMPORTS_PER_SOL
+
+# Tables as created by SQLModel.metadata.create_all before schema versioning
+BASELINE_SCHEMA = """
+CREATE TABLE account (
+    telegram_id INTEGER NOT NULL,
+    sol_balance FLOAT NOT NULL,
+    PRIMARY KEY (telegram_id)
+);
+CREATE TABLE position (
+    id INTEGER NOT NULL,
+    telegram_id INTEGER NOT NULL,
+    token_address VARCHAR NOT NULL,
+    quantity FLOAT NOT NULL,
+    entry_price FLOAT NOT NULL,
+    entry_mcap FLOAT NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(telegram_id) REFERENCES account (telegram_id)
+);
+INSERT INTO account VALUES (1, 12.5);
+INSERT INTO account VALUES (2, 0.000000001);
+INSERT INTO account VALUES (3, 8.2);
+INSERT INTO position VALUES (7, 1, 'TokenA', 1500.25, 0.002, 1000000.0);
+INSERT INTO position VALUES (8, 3, 'TokenB', 1.005, 0.5, 2000.0);
+"""
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = tmp_path / "paper_trading.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    return path
+
+
+def user_version(path) -> int:
+    with sqlite3.connect(path) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+def test_upgrades_baseline_database(baseline_db):
+    database = Database(f"sqlite:///{baseline_db}")
+
+    assert user_version(baseline_db) == SCHEMA_VERSION
+    assert database.get_account(1).lamports == 12_500_000_000
+    assert database.get_account(2).lamports == 1
+    # Not exact in binary: truncating would lose a lamport or base unit
+    assert database.get_account(3).lamports == 8_200_000_000
+    assert database.get_position(3, "TokenB").quantity == 1_005_000
+
+    [position] = database.get_positions(1)
+    assert position.id == 7
+    assert position.quantity == 1_500_250_000
+    assert position.decimals == 6
+    assert position.cost_lamports == round(1500.25 * 0.002 * LAMPORTS_PER_SOL)
+    assert position.entry_mcap == 1000000.0
+
+
+def test_interrupted_upgrade_leaves_database_untouched(baseline_db, monkeypatch):
+    def failing_migration(conn):
+        migrate(conn)
+        raise RuntimeError("interrupted")
+
+    migrate = db.MIGRATIONS[1]
+    monkeypatch.setitem(db.MIGRATIONS, 1, failing_migration)
+
+    with pytest.raises(RuntimeError, match="interrupted"):
+        Database(f"sqlite:///{baseline_db}")
+
+    assert user_version(baseline_db) == 0
+    with sqlite3.connect(baseline_db) as conn:
+        tables = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        balances = conn.execute("SELECT sol_balance FROM account").fetchall()
+    conn.close()
+    assert tables == {"account", "position"}
+    assert balances == [(12.5,), (0.000000001,), (8.2,)]
+
+    # The next boot runs the whole upgrade again
+    monkeypatch.setitem(db.MIGRATIONS, 1, migrate)
+    database = Database(f"sqlite:///{baseline_db}")
+    assert database.get_account(1).lamports == 12_500_000_000
+
+
+def test_refuses_to_start_over_leftover_upgrade_tables(baseline_db):
+    with sqlite3.connect(baseline_db) as conn:
+        conn.execute("ALTER TABLE account RENAME TO account_v1")
+    conn.close()
+
+    with pytest.raises(RuntimeError, match="account_v1"):
+        Database(f"sqlite:///{baseline_db}")
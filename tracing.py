@@ -0,0 +1,151 @@
+"""Span tracing and stack sampling with no third-party dependencies.
+
+Spans are only recorded while a trace is active in the current context (see
+telegram_tracing.TracedApplication), so decorated code pays a single ContextVar
+lookup otherwise.
+"""
+
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Spans of the update currently being processed, None when not tracing
+current_trace: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def span(kind: str, name: str) -> Iterator[None]:
+    """Record a timed span if an update trace is active."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        trace.append(
+            {
+                "kind": kind,
+                "name": name,
+                "start": start,
+                "duration_ms": (time.perf_counter() - start) * 1000,
+                "error": error,
+            }
+        )
+
+
+def traced(kind: str, name: Optional[str] = None) -> Callable:
+    """Decorate a function or coroutine function so its calls become spans."""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(kind, span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(kind: str) -> Callable[[type], type]:
+    """Class decorator applying `traced` to every public method."""
+
+    def decorator(cls: type) -> type:
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr, traced(kind)(value))
+        return cls
+
+    return decorator
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's stack into flamegraph-ready counts.
+
+    Sampling happens on a background thread, so the sampled thread (the one
+    running the event loop and the handlers) pays nothing beyond the GIL hand-off.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._target_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target_thread_id: Optional[int] = None) -> None:
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+
+        self.samples.clear()
+        self._target_thread_id = target_thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Render samples in collapsed-stack format (flamegraph.pl, speedscope)."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def dump(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path